@@ -2,23 +2,32 @@
 import os
 import sys
 import logging
+import threading
+from types import MappingProxyType
+from typing import Optional
 from dotenv import load_dotenv
 
-import openai # Import AzureOpenAI correctly. Replace with the appropriate import based on your SDK
-from openai import AzureOpenAI  # Ensure this import is correct or replace with the appropriate class
-
-# Set up logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stdout),
-        # Uncomment the following line to also log to a file
-        # logging.FileHandler("transcription.log")
-    ]
-)
+import httpx
+from openai import AsyncAzureOpenAI, DefaultAsyncHttpxClient
+
 logger = logging.getLogger(__name__)
 
+# Parsed credentials keyed by absolute .env path -> (mtime, creds)
+_CREDENTIALS_CACHE = {}
+
+# Attempts after the first for rate-limited (429), 5xx, timeout, and connection
+# failures. The SDK retries these itself with exponential backoff and jitter,
+# honouring the service's Retry-After header.
+MAX_RETRIES = 6
+
+# Process-wide AsyncAzureOpenAI client, shared so connections and auth are reused
+_CLIENT: Optional[AsyncAzureOpenAI] = None
+_CLIENT_LOCK = threading.Lock()
+
+# Connection pool of the shared client: enough connections for every request
+# in flight, kept alive between requests so each one skips the TLS handshake
+HTTP_POOL_LIMITS = httpx.Limits(max_connections=64, max_keepalive_connections=64, keepalive_expiry=120)
+
 def load_api_credentials(secrets_dir=None):
     """
     Load the .env file from the specified directory (or current dir) 
@@ -32,18 +41,30 @@ def load_api_credentials(secrets_dir=None):
             'deployment_id': '...'
         }
     }
+
+    The parsed result is cached per .env path and only re-read when the
+    file's modification time changes. The returned mapping is read-only.
     """
     if secrets_dir:
         dotenv_path = os.path.join(secrets_dir, '.env')
     else:
         dotenv_path = '.env'  # Default to the current directory
+    dotenv_path = os.path.abspath(dotenv_path)
 
-    if not os.path.exists(dotenv_path):
+    try:
+        mtime = os.path.getmtime(dotenv_path)
+    except OSError:
         logging.error(f"No .env file found at {dotenv_path}.")
         return None
+
+    # Skip re-parsing when the .env file hasn't changed since the last load
+    cached = _CREDENTIALS_CACHE.get(dotenv_path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
     
-    # Load environment variables from .env
-    load_dotenv(dotenv_path)
+    # Load environment variables from .env. When re-reading an edited file,
+    # override the values the previous load put into os.environ
+    load_dotenv(dotenv_path, override=cached is not None)
     
     # Debugging: Print each environment variable
     azure_api_key = os.getenv("AZURE_OPENAI_API_KEY")
@@ -55,13 +76,13 @@ def load_api_credentials(secrets_dir=None):
     print(f"AZURE_OPENAI_DEPLOYMENT: {azure_deployment}")
     
     # Build a dictionary of credentials
-    creds = {
-        "azure_speech_to_text": {
+    creds = MappingProxyType({
+        "azure_speech_to_text": MappingProxyType({
             "api_key": azure_api_key,
             "endpoint": azure_endpoint,
             "deployment_id": azure_deployment
-        }
-    }
+        })
+    })
     
     print("Loaded credentials:", creds)
 
@@ -70,44 +91,59 @@ def load_api_credentials(secrets_dir=None):
         if not service_data["api_key"]:
             logging.warning(f"API key missing for service '{service_name}'. Check your .env.")
 
+    _CREDENTIALS_CACHE[dotenv_path] = (mtime, creds)
     return creds
 
 def create_client(creds):
     
     """
-    Create and return an AzureOpenAI client if Azure keys are found.
+    Create and return an AsyncAzureOpenAI client if Azure keys are found.
     Exits the program if Azure credentials are missing.
+
+    The client is built once per process and reused on subsequent calls,
+    so its HTTP connection pool is shared across transcription requests.
     
     Returns:
         client, deployment_id
-        - client: AzureOpenAI client
+        - client: AsyncAzureOpenAI client
         - deployment_id: Azure deployment ID
     """
-    
+    global _CLIENT
 
-    # 2) Extract Azure credentials from creds
+    # 1) Extract Azure credentials from creds
     azure_api_key = creds["azure_speech_to_text"]["api_key"]
     azure_endpoint = creds["azure_speech_to_text"]["endpoint"]
     azure_deployment = creds["azure_speech_to_text"]["deployment_id"]
-    
-    openai.api_key = creds["azure_speech_to_text"]["api_key"]
-    openai.api_base = os.getenv("AZURE_OPENAI_ENDPOINT")
-    openai.api_type = "azure"
-    openai.api_version = "2024-02-01"
-    
 
-    # 3) Check if Azure keys are available (non-empty).
-    if azure_api_key and azure_endpoint and azure_deployment:
-        logging.info("Using Azure OpenAI credentials.")
-        
-        # Initialize the AzureOpenAI client
-        client = AzureOpenAI(
-            api_key=azure_api_key,  
-            api_version="2024-02-01",  # Replace with your actual Azure OpenAI API version
-            azure_endpoint=azure_endpoint
-        )
-        
-        return client, azure_deployment
-    else:
+    # 2) Check if Azure keys are available (non-empty).
+    if not (azure_api_key and azure_endpoint and azure_deployment):
         logging.error("Azure API credentials are missing or incomplete. Exiting.")
-        sys.exit(1)
\ No newline at end of file
+        sys.exit(1)
+
+    with _CLIENT_LOCK:
+        if _CLIENT is None:
+            logging.info("Using Azure OpenAI credentials.")
+
+            # Initialize the AsyncAzureOpenAI client
+            _CLIENT = AsyncAzureOpenAI(
+                api_key=azure_api_key,  
+                api_version="2024-02-01",  # Replace with your actual Azure OpenAI API version
+                azure_endpoint=azure_endpoint,
+                max_retries=MAX_RETRIES,
+                # The SDK's default client (its timeouts and redirect handling),
+                # with a larger connection pool
+                http_client=DefaultAsyncHttpxClient(limits=HTTP_POOL_LIMITS)
+            )
+
+    return _CLIENT, azure_deployment
+
+async def close_client():
+    """
+    Close the shared client and its pooled connections, if it was created.
+    Must run on the event loop the client was used on.
+    """
+    global _CLIENT
+    with _CLIENT_LOCK:
+        client, _CLIENT = _CLIENT, None
+    if client is not None:
+        await client.close()
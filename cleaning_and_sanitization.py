@@ -1,42 +1,87 @@
 
-import sys
 import logging
 import os
 import re
-import pysrt
-
-# Set up logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stdout),
-        # Uncomment the following line to also log to a file
-        # logging.FileHandler("transcription.log")
-    ]
-)
+from collections import Counter
+from functools import lru_cache
+from pathlib import Path
+
 logger = logging.getLogger(__name__)
 
+_PUNCT_RE = re.compile(r'[^\w\s]')
+# One SRT cue: index line, timing line, then zero or more non-empty text
+# lines; the text stops at the first blank line, so a cue with no text
+# never runs into the cue after it
+_SRT_CUE_RE = re.compile(
+    r'(\d+)[ \t]*\n(\d\d:\d\d:\d\d[,.]\d+ --> \d\d:\d\d:\d\d[,.]\d+[^\n]*)((?:\n[^\n]+)*)'
+)
+
 def normalize_phrase(phrase):
     """
     Normalize the phrase by removing punctuation and reducing whitespace.
     """
-    # Remove punctuation
-    phrase = re.sub(r'[^\w\s]', '', phrase)
-    # Reduce multiple spaces to single space
-    phrase = re.sub(r'\s+', ' ', phrase)
-    return phrase.strip().lower()
+    # Remove punctuation, then collapse whitespace runs (and trim) with split/join
+    return ' '.join(_PUNCT_RE.sub('', phrase).split()).lower()
+
+# Phrases the transcription model tends to hallucinate (mostly echoes of the
+# prompt); normalized once at import so sanitization can match them directly.
+_BLOCKED_PHRASES = frozenset(normalize_phrase(phrase) for phrase in (
+    "If the audio file contain only music or some section contain music then ignore music and non vocals.",
+    "The audio file must only contain english language and non vocals.",
+    "If the audio file contain only music or some section contain non vocals then ignore music and non vocals.",
+    "If the audio file contain only music and non vocals then ignore music and non vocals.",
+    "This is the audio file.",
+    "Does the video made by Jason Blazer reference in bildamic on davinci 3200?",
+    "the files are not shown in davinci due to security reason.",
+    "The files share dictations",
+    "If the audio file contain only music or some section contain music and non vocals then ignore music and non vocals.",
+    "Leave it in the menu Preview option.",
+    "The audio file must contain only music and non vocals.",
+    "I displayed that the audio file in SIREN use English speaking ASL and not a mixed language.",
+    "Don't forget to comment your opinion.",
+    "Because it not need it.",
+    "Hope this ...",
+))
+
+# Blocked phrases with at least this many words are long prompt echoes that
+# are removed wherever they appear inside a subtitle; shorter, generic ones
+# ("hope this") are only removed when they make up the whole subtitle, since
+# they also occur in real speech
+BLOCKED_PHRASE_SUBSTRING_MIN_WORDS = 8
+
+@lru_cache(maxsize=None)
+def build_phrase_matcher(phrases):
+    """
+    Build a single compiled pattern that finds any of the given normalized
+    phrases as whole words inside a subtitle, so each subtitle is scanned
+    once instead of being checked against every phrase individually.
+
+    Args:
+        phrases (frozenset of str): Normalized phrases to match.
 
-def sanitize_srt_file(srt_file_path, max_repeats=5, additional_phrases=None):
+    Returns None if there are no (non-empty) phrases.
+    """
+    phrases = [phrase for phrase in phrases if phrase]
+    if not phrases:
+        return None
+    # Longest phrases first so overlapping alternatives prefer the full match
+    phrases.sort(key=len, reverse=True)
+    return re.compile(r'\b(?:' + '|'.join(re.escape(phrase) for phrase in phrases) + r')\b')
+
+def sanitize_srt_file(srt_file_path, max_repeats=5, blocked_phrases=frozenset()):
     """
     Sanitize the .srt file by:
     1. Removing phrases that are repeated more than or equal to max_repeats times.
-    2. Removing additional specified phrases even if they appear only once.
+    2. Removing subtitles that match an additional specified phrase, even if
+       it appears only once. Every phrase removes a subtitle that consists of
+       exactly that phrase; phrases of BLOCKED_PHRASE_SUBSTRING_MIN_WORDS or
+       more words also remove subtitles that contain them as whole words.
     
     Args:
         srt_file_path (str): Path to the .srt file to be sanitized.
         max_repeats (int): Maximum allowed repetitions for any phrase.
-        additional_phrases (set of str): Phrases to remove regardless of repetition count.
+        blocked_phrases (frozenset of str): Already-normalized phrases to remove
+            regardless of repetition count (see normalize_phrase).
     
     Returns:
         None
@@ -47,45 +92,46 @@ def sanitize_srt_file(srt_file_path, max_repeats=5, additional_phrases=None):
         #shutil.copyfile(srt_file_path, backup_path)
         #logging.info(f"Backup created at: {backup_path}")
 
-        # Load the subtitle file
-        subtitles = pysrt.open(srt_file_path, encoding='utf-8')
+        # Parse the subtitle file into (timing, text) cues
+        srt_path = Path(srt_file_path)
+        content = srt_path.read_text(encoding='utf-8-sig').replace('\r\n', '\n')
+        subtitles = [(match.group(2), match.group(3).strip()) for match in _SRT_CUE_RE.finditer(content)]
 
-        # Create a dictionary to count phrase occurrences (normalized)
-        phrase_counts = {}
-        for subtitle in subtitles:
-            phrase = normalize_phrase(subtitle.text)
-            if phrase in phrase_counts:
-                phrase_counts[phrase] += 1
-            else:
-                phrase_counts[phrase] = 1
+        # Normalize each distinct subtitle text once (repeats are exactly what
+        # we are looking for, so there are usually many) and count occurrences
+        texts = [text for _, text in subtitles]
+        normalized_by_text = {text: normalize_phrase(text) for text in set(texts)}
+        normalized = [normalized_by_text[text] for text in texts]
+        phrase_counts = Counter(normalized)
 
         # Identify phrases to remove (those repeated more than or equal to max_repeats times)
         over_repeated_phrases = {phrase for phrase, count in phrase_counts.items() if count >= max_repeats}
-        logging.info(f"Phrases to remove (repeated >= {max_repeats} times): {over_repeated_phrases}")
-
-        # Initialize additional_phrases if not provided
-        if additional_phrases is None:
-            additional_phrases = set()
-
-        # Normalize and add additional phrases to remove
-        normalized_additional_phrases = {normalize_phrase(phrase) for phrase in additional_phrases}
-        logging.info(f"Additional phrases to remove: {normalized_additional_phrases}")
-
-        # Combine all phrases to remove
-        phrases_to_remove = over_repeated_phrases.union(normalized_additional_phrases)
-        logging.info(f"Total phrases to remove: {phrases_to_remove}")
-
-        # Remove subtitle entries containing the phrases to remove by modifying in-place
-        subtitles[:] = [
-            subtitle for subtitle in subtitles 
-            if normalize_phrase(subtitle.text) not in phrases_to_remove
-        ]
-
-        # Clean the indexes to ensure sequential numbering
-        subtitles.clean_indexes()
+        # These sets can be large; only stringify them when INFO is enabled
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("Phrases to remove (repeated >= %d times): %s", max_repeats, over_repeated_phrases)
+            logger.info("Additional phrases to remove: %s", set(blocked_phrases))
+        blocked_matcher = build_phrase_matcher(frozenset(
+            phrase for phrase in blocked_phrases if len(phrase.split()) >= BLOCKED_PHRASE_SUBSTRING_MIN_WORDS
+        ))
+
+        # Decide removal once per distinct phrase rather than once per cue
+        phrases_to_remove = set(over_repeated_phrases)
+        phrases_to_remove.update(phrase_counts.keys() & set(blocked_phrases))
+        if blocked_matcher:
+            phrases_to_remove.update(phrase for phrase in phrase_counts if blocked_matcher.search(phrase))
+
+        # Keep cues that are neither over-repeated nor match a blocked phrase,
+        # renumbering them sequentially as they are written out
+        output = []
+        index = 1
+        for (timing, text), phrase in zip(subtitles, normalized):
+            if phrase in phrases_to_remove:
+                continue
+            output.append(f"{index}\n{timing}\n{text}\n\n")
+            index += 1
 
         # Save the cleaned subtitles back to the file
-        subtitles.save(srt_file_path, encoding='utf-8')
+        srt_path.write_text(''.join(output), encoding='utf-8')
         logging.info(f"Sanitized .srt file saved at: {srt_file_path}")
 
     except Exception as e:
@@ -103,36 +149,21 @@ def cleanup_output_dir(video_output_dir):
     """
     # Get the base name of the directory (e.g., 'PN结及其单向导电性')
     video_dir_name = os.path.basename(video_output_dir)
-    
-    # Define additional phrases to remove
-    additional_phrases_to_remove = {
-        "If the audio file contain only music or some section contain music then ignore music and non vocals."
-        "The audio file must only contain english language and non vocals."
-        "If the audio file contain only music or some section contain non vocals then ignore music and non vocals."
-        "If the audio file contain only music and non vocals then ignore music and non vocals."
-        "This is the audio file."
-        "Does the video made by Jason Blazer reference in bildamic on davinci 3200?"
-        "the files are not shown in davinci due to security reason."
-        "The files share dictations"
-        "If the audio file contain only music or some section contain music and non vocals then ignore music and non vocals."
-        "Leave it in the menu Preview option."
-        "The audio file must contain only music and non vocals."
-        "If the audio file contain only music and non vocals then ignore music and non vocals."
-        "If the audio file contain only music or some section contain music and non vocals then ignore music and non vocals."
-        "I displayed that the audio file in SIREN use English speaking ASL and not a mixed language."
-        "Don't forget to comment your opinion."
-        "Because it not need it."
-        "Hope this ..."
-    }
 
     # Flag to check if a subtitle file has been renamed to prevent multiple renames
     subtitle_renamed = False
 
-    for filename in os.listdir(video_output_dir):
-        file_path = os.path.join(video_output_dir, filename)
+    # Snapshot the directory up front since files are removed/renamed below;
+    # DirEntry caches the file type, avoiding an extra stat per entry
+    with os.scandir(video_output_dir) as it:
+        entries = list(it)
+
+    for entry in entries:
+        filename = entry.name
+        file_path = entry.path
 
         # Check if it's a file
-        if os.path.isfile(file_path):
+        if entry.is_file():
             # If the file is not an .srt file, remove it
             if not filename.lower().endswith('.srt'):
                 try:
@@ -156,7 +187,7 @@ def cleanup_output_dir(video_output_dir):
                             subtitle_renamed = True  # Prevent further renames
 
                             # Sanitize the renamed .srt file with additional phrases
-                            sanitize_srt_file(new_file_path, max_repeats=5, additional_phrases=additional_phrases_to_remove)
+                            sanitize_srt_file(new_file_path, max_repeats=5, blocked_phrases=_BLOCKED_PHRASES)
 
                         except Exception as e:
                             logging.error(f"Failed to rename {file_path} to {new_file_path}: {e}")
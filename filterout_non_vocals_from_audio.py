@@ -1,24 +1,41 @@
 
 import torch
-import sys
 import logging
-import os
 import subprocess
-import demucs.separate
-import shutil
-
-# Set up logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stdout),
-        # Uncomment the following line to also log to a file
-        # logging.FileHandler("transcription.log")
-    ]
-)
+from pathlib import Path
+from demucs.apply import apply_model
+from demucs.audio import save_audio
+from demucs.pretrained import get_model
+from demucs.separate import load_track
+
 logger = logging.getLogger(__name__)
 
+# Probe the CUDA driver once at import
+_HAS_CUDA = torch.cuda.is_available()
+
+# Demucs model, loaded on first use and kept resident for every later video
+_MODEL = None
+
+
+def get_demucs_model():
+    """
+    Load the htdemucs model once per process and return the cached instance.
+    """
+    global _MODEL
+    if _MODEL is None:
+        logging.info("Loading Demucs model 'htdemucs'.")
+        _MODEL = get_model('htdemucs')
+        _MODEL.eval()
+    return _MODEL
+
+
+def autocast_dtype():
+    """
+    Pick the reduced-precision dtype for GPU inference: bfloat16 on Ampere
+    or newer, float16 otherwise.
+    """
+    major, _ = torch.cuda.get_device_capability()
+    return torch.bfloat16 if major >= 8 else torch.float16
 
 
 # Validate if CUDA is available
@@ -27,7 +44,7 @@ def validate_device(device):
     Check if CUDA is available and return the appropriate device.
     """
     if device.lower() == 'gpu':
-        if torch.cuda.is_available():
+        if _HAS_CUDA:
             logging.info("CUDA is available. Using GPU.")
             return 'cuda'
         else:
@@ -36,10 +53,13 @@ def validate_device(device):
     return 'cpu'
 
 
-# Separate Audio Function (Ensure this is defined before process_video)
+# Separate Audio Function
 def separate_audio(input_audio_path, video_dir, device):
     """
     Use Demucs to separate the audio and extract both the vocal and non-vocal tracks.
+
+    Returns:
+        (processed_vocals_mp3_path, non_vocals_wav_path), or (None, None) on failure.
     """
     
     if device == 'cuda':
@@ -48,67 +68,64 @@ def separate_audio(input_audio_path, video_dir, device):
         logging.info("Using CPU for audio separation.")
         
     try:
-        # Run Demucs for audio separation, explicitly specifying output directory
+        # Run Demucs for audio separation with the resident model
         print(f"Running Demucs separation on: {input_audio_path} with device: {device}")
-        demucs.separate.main([
-            '-n', 'htdemucs',
-            '--two-stems=vocals',
-            '--out', video_dir,
-            '--device', device,
-            input_audio_path
-        ])  # Separate into vocals and no_vocals
-        
-        # Assuming the output directory structure; adjust as per actual Demucs output
-        separated_dir = os.path.join(video_dir, 'htdemucs', f'{os.path.splitext(os.path.basename(input_audio_path))[0]}')
-        logging.info(f"Demucs output directory: {separated_dir}")
-
-        # Find the 'vocals.wav' and 'no_vocals.wav' files from Demucs output
-        vocals_path = os.path.join(separated_dir, 'vocals.wav')
-        non_vocals_path = os.path.join(separated_dir, 'no_vocals.wav')
-
-        if os.path.exists(vocals_path) and os.path.exists(non_vocals_path):
-            logging.info(f"Found vocals.wav at: {vocals_path} and no_vocals.wav at: {non_vocals_path}")
-
-            # Construct the new names with the original file name and suffixes
-            base_name = os.path.splitext(os.path.basename(input_audio_path))[0]
-            new_vocals_path = os.path.join(video_dir, f'{base_name}_vocals.wav')
-            new_non_vocals_path = os.path.join(video_dir, f'{base_name}_non_vocals.wav')
-
-            # Move both files to the desired locations
-            shutil.move(vocals_path, new_vocals_path)
-            shutil.move(non_vocals_path, new_non_vocals_path)
-            logging.info(f"Moved vocals.wav to: {new_vocals_path} and no_vocals.wav to: {new_non_vocals_path}")
-            
-            # Process the vocals.wav to convert it to mono and reduce bitrate
-            processed_vocals_path = os.path.join(video_dir, f'{base_name}_vocals_processed')
-            logging.info(f"Processing vocals to mono and reducing bitrate: {processed_vocals_path}")
-            # ffmpeg_command = f"ffmpeg -y -i \"{new_vocals_path}\" -ac 1 -ar 16000 -b:a 48k \"{processed_vocals_path}\""
-            # ffmpeg_command = f"ffmpeg -y -i \"{new_vocals_path}\" -c:a libmp3lame -ac 1 -ar 16000 -b:a 64k \"{processed_vocals_path}.mp3\""
-            
-            # ffmpeg_command = f"ffmpeg -y -i \"{new_vocals_path}\" -map 0:a -c:a libmp3lame -ac 1 -ar 16000 -b:a 64k -map_metadata -1 \"{processed_vocals_path}.mp3\""
-            
-            ffmpeg_command = f"""
-            ffmpeg -y -i "{new_vocals_path}" \
-                -map 0:a -vn -sn -dn \
-                -c:a libmp3lame \
-                -ac 1 \
-                -ar 16000 \
-                -b:a 64k \
-                -map_metadata -1 \
-                "{processed_vocals_path}.mp3"
-            """
-            subprocess.run(ffmpeg_command, shell=True, check=True)
-            logging.info(f"Processed vocals file saved at: {processed_vocals_path}")
-
-            # Remove the htdemucs directory and everything underneath it
-            shutil.rmtree(os.path.join(video_dir, 'htdemucs'))
-            logging.info(f"Removed the htdemucs directory and its contents.")
-
-            return processed_vocals_path, new_non_vocals_path
-        else:
-            logging.error(f"Error: No vocals.wav or no_vocals.wav found in the 'separated' directory.")
+        model = get_demucs_model()
+        if 'vocals' not in model.sources:
+            logging.error("Error: Demucs model has no 'vocals' source to separate.")
             return None, None
 
+        # Load and normalize the track the same way the demucs CLI does
+        wav = load_track(input_audio_path, model.audio_channels, model.samplerate)
+        ref = wav.mean(0)
+        wav = (wav - ref.mean()) / ref.std()
+
+        # On GPU run the convolution/attention layers in reduced precision;
+        # autocast keeps precision-sensitive ops (e.g. the STFT) in float32
+        use_autocast = device == 'cuda'
+        dtype = autocast_dtype() if use_autocast else None
+        with torch.inference_mode(), torch.autocast('cuda', dtype=dtype, enabled=use_autocast):
+            sources = apply_model(model, wav[None], device=device, split=True, overlap=0.25, progress=False)[0]
+        sources = sources.float() * ref.std() + ref.mean()
+
+        # Two stems: vocals, and everything else summed as no_vocals
+        vocals_index = model.sources.index('vocals')
+        vocals = sources[vocals_index]
+        non_vocals = sum(source for i, source in enumerate(sources) if i != vocals_index)
+
+        # Construct the new names with the original file name and suffixes
+        base_name = Path(input_audio_path).stem
+        output_dir = Path(video_dir)
+        new_non_vocals_path = str(output_dir / f'{base_name}_non_vocals.wav')
+        processed_vocals_path = str(output_dir / f'{base_name}_vocals_processed.mp3')
+
+        # Only the non-vocals stem is kept as a WAV file
+        save_audio(non_vocals, new_non_vocals_path, samplerate=model.samplerate)
+        logging.info(f"Saved non vocals to: {new_non_vocals_path}")
+
+        # Pipe the vocals stem straight into ffmpeg to convert it to mono and reduce bitrate
+        logging.info(f"Processing vocals to mono and reducing bitrate: {processed_vocals_path}")
+        ffmpeg_command = [
+            'ffmpeg', '-y',
+            '-f', 'f32le',
+            '-ar', str(model.samplerate),
+            '-ac', str(vocals.shape[0]),
+            '-i', 'pipe:0',
+            '-c:a', 'libmp3lame',
+            '-ac', '1',
+            '-ar', '16000',
+            '-b:a', '64k',
+            '-map_metadata', '-1',
+            processed_vocals_path
+        ]
+        # ffmpeg expects interleaved samples, i.e. (time, channels) in memory
+        vocals_pcm = vocals.t().contiguous().cpu().numpy().tobytes()
+        subprocess.run(ffmpeg_command, input=vocals_pcm, check=True)
+        logging.info(f"Processed vocals file saved at: {processed_vocals_path}")
+
+        return processed_vocals_path, new_non_vocals_path
+
     except Exception as e:
         logging.error(f"Error processing with Demucs: {e}")
-        return None, None
\ No newline at end of file
+        return None, None
+
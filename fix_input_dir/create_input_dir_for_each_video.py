@@ -3,6 +3,9 @@ import shutil
 import argparse
 import sys
 import logging
+from concurrent.futures import ThreadPoolExecutor
+
+_VIDEO_EXTS = ('.mp4', '.mov', '.mkv', '.avi')
 
 def parse_arguments():
     parser = argparse.ArgumentParser(
@@ -24,9 +27,7 @@ def parse_arguments():
     return parser.parse_args()
 
 def is_video_file(filename):
-    video_extensions = ['.mp4', '.mov', '.mkv', '.avi']
-    _, ext = os.path.splitext(filename)
-    return ext.lower() in video_extensions
+    return filename.lower().endswith(_VIDEO_EXTS)
 
 def sanitize_directory_name(name):
     """
@@ -53,6 +54,38 @@ def remove_trailing_dot(file_path):
         return new_path
     return file_path
 
+def copy_video(source_path, video_dir, destination_path):
+    """
+    Place a single video file into its directory, logging the outcome.
+
+    A hardlink is tried first, which is instant and uses no extra space when
+    input and output are on the same filesystem; otherwise the file is copied.
+    """
+    item = os.path.basename(destination_path)
+    # Already linked by a previous run
+    if os.path.exists(destination_path) and os.path.samefile(source_path, destination_path):
+        print(f"'{item}' is already in '{video_dir}'")
+        logging.info(f"'{item}' is already in '{video_dir}'")
+        return
+
+    try:
+        os.link(source_path, destination_path)
+        print(f"Linked '{item}' into '{video_dir}'")
+        logging.info(f"Linked '{item}' into '{video_dir}'")
+        return
+    except OSError:
+        # Cross-device, already exists, or links unsupported: fall back to a copy
+        pass
+
+    try:
+        # Copy the video file to the destination directory
+        shutil.copy2(source_path, destination_path)
+        print(f"Copied '{item}' to '{video_dir}'")
+        logging.info(f"Copied '{item}' to '{video_dir}'")
+    except Exception as e:
+        print(f"Failed to copy '{item}': {e}")
+        logging.error(f"Failed to copy '{item}': {e}")
+
 def create_video_directories(input_dir, output_dir):
     # Ensure input directory exists
     if not os.path.isdir(input_dir):
@@ -62,12 +95,19 @@ def create_video_directories(input_dir, output_dir):
     # Create output directory if it doesn't exist
     os.makedirs(output_dir, exist_ok=True)
     
-    # Iterate over files in input directory
-    for item in os.listdir(input_dir):
-        input_path = os.path.join(input_dir, item)
+    # (source, video_dir, destination) for every video to copy
+    copy_jobs = []
+
+    # Iterate over files in input directory (snapshot first, files may be renamed below)
+    with os.scandir(input_dir) as it:
+        entries = list(it)
+
+    for entry in entries:
+        item = entry.name
+        input_path = entry.path
         
         # Process only files (skip directories)
-        if os.path.isfile(input_path) and is_video_file(item):
+        if entry.is_file(follow_symlinks=False) and is_video_file(item):
             # Check and remove trailing dot if present
             corrected_input_path = remove_trailing_dot(input_path)
             corrected_item = os.path.basename(corrected_input_path)
@@ -85,15 +125,12 @@ def create_video_directories(input_dir, output_dir):
             
             # Define the destination path for the video
             destination_path = os.path.join(video_dir, corrected_item)
-            
-            try:
-                # Copy the video file to the destination directory
-                shutil.copy2(corrected_input_path, destination_path)
-                print(f"Copied '{corrected_item}' to '{video_dir}'")
-                logging.info(f"Copied '{corrected_item}' to '{video_dir}'")
-            except Exception as e:
-                print(f"Failed to copy '{corrected_item}': {e}")
-                logging.error(f"Failed to copy '{corrected_item}': {e}")
+            copy_jobs.append((corrected_input_path, video_dir, destination_path))
+
+    # Copies are I/O-bound, so run several at once to keep the disk busy
+    max_workers = min(8, (os.cpu_count() or 1) * 2)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(lambda job: copy_video(*job), copy_jobs))
 
 def main():
     # Configure logging
@@ -0,0 +1,29 @@
+
+import sys
+import logging
+
+# Set once the root logger has been configured for this process
+_CONFIGURED = False
+
+def configure(level=logging.INFO):
+    """
+    Configure the root logger for the transcription tools.
+
+    Safe to call more than once; only the first call installs handlers.
+    Library modules should only call logging.getLogger(__name__) and leave
+    handler setup to the entry point.
+    """
+    global _CONFIGURED
+    if _CONFIGURED:
+        return
+
+    logging.basicConfig(
+        level=level,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.StreamHandler(sys.stdout),
+            # Uncomment the following line to also log to a file
+            # logging.FileHandler("transcription.log")
+        ]
+    )
+    _CONFIGURED = True
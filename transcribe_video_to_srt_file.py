@@ -2,27 +2,23 @@ import sys
 import logging
 import os
 import argparse
+import csv
 import subprocess
 import asyncio
+import atexit
+import io
 import shutil
+import tempfile
 import time
+import wave
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from filterout_non_vocals_from_audio import validate_device, separate_audio
 from cleaning_and_sanitization import cleanup_output_dir 
-from azure_openai import load_api_credentials, create_client
-from utils import convert_to_srt, format_time, save_srt_file,  fix_first_segment_start_time
+from azure_openai import load_api_credentials, create_client, close_client
+from utils import iter_srt, format_time, save_srt_stream,  fix_first_segment_start_time, merge_transcriptions
+import logging_setup
 
 
-
-# Set up logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stdout),
-        # Uncomment the following line to also log to a file
-        # logging.FileHandler("transcription.log")
-    ]
-)
 logger = logging.getLogger(__name__)
 
 
@@ -32,89 +28,283 @@ SUPPORTED_LANGUAGES = {
     # Add other supported languages here, e.g., "es": "Spanish"
 }
 
+# Language every transcription request asks for. main() only accepts
+# --speech-to-text values from SUPPORTED_LANGUAGES, so it isn't rechecked per file
+TRANSCRIPTION_LANGUAGE = "en"
+SRT_FILE_SUFFIX = f"_{TRANSCRIPTION_LANGUAGE}.srt"
+
+# Prompt sent with every transcription request, rendered once
+TARGET_LANGUAGE_DESCRIPTION = "english language"
+WHISPER_PROMPT = (
+    f"use the provided audio file, and convert audio speech language into {TARGET_LANGUAGE_DESCRIPTION}. "
+    f"The output srt formatted file must only contain {TARGET_LANGUAGE_DESCRIPTION} and not a mix of languages. "
+    "If the audio file contain only music or some section contain music then ignore music and non vocals."
+)
+
+# Video file extensions picked up from --input-dir
+VIDEO_EXTS = ('.mp4', '.avi', '.mov', '.mkv')
+
+# Default number of transcription requests in flight at once; set
+# AZURE_OPENAI_MAX_CONCURRENCY in the .env to match the deployment's rate limit
+DEFAULT_MAX_CONCURRENT_TRANSCRIPTIONS = 8
 
-# Check if the video has subtitles
-def has_subtitles(video_path):
+# Videos that may wait, prepared, for transcription per worker process; their
+# decoded audio stays in memory until they are transcribed
+READY_VIDEOS_PER_WORKER = 2
+
+# Long audio is split into pieces of at most this many seconds before upload:
+# each request stays well under the 25 MB Azure Whisper limit, and the pieces
+# of one file can be transcribed in parallel
+AUDIO_CHUNK_SECONDS = 600
+
+# Format of the audio sent for transcription: 16 kHz, mono, 16-bit PCM
+AUDIO_SAMPLE_RATE = 16000
+AUDIO_SAMPLE_WIDTH = 2
+
+# Keep ffmpeg's captured stderr down to actual errors; the banner and
+# per-frame progress lines otherwise produce a large, constant pipe stream
+FFMPEG_LOG_ARGS = ['-hide_banner', '-nostats', '-loglevel', 'error']
+
+
+def run_ffmpeg(ffmpeg_command, check=True, capture_stdout=False):
     """
-    Check if the given video file contains subtitles.
+    Run an ffmpeg command with stdout discarded (unless capture_stdout) and
+    stderr spooled to a temporary file instead of held in a pipe. stderr is
+    only read back when ffmpeg fails, so memory use stays bounded however
+    much it prints.
+
+    Returns a CompletedProcess whose stderr is the error output (bytes) on
+    failure and b'' on success. Raises CalledProcessError on failure if check.
     """
-    try:
-        probe = subprocess.run(
-            ['ffprobe', '-v', 'error', '-select_streams', 's', '-show_entries', 'stream=index', '-of', 'csv=p=0', video_path],
-            capture_output=True, text=True
+    with tempfile.TemporaryFile() as stderr_file:
+        result = subprocess.run(
+            ffmpeg_command,
+            stdout=subprocess.PIPE if capture_stdout else subprocess.DEVNULL,
+            stderr=stderr_file
         )
-        return bool(probe.stdout.strip())
-    except subprocess.CalledProcessError:
-        return False
+        result.stderr = b''
+        if result.returncode != 0:
+            stderr_file.seek(0)
+            result.stderr = stderr_file.read()
+            if check:
+                raise subprocess.CalledProcessError(result.returncode, ffmpeg_command, output=result.stdout, stderr=result.stderr)
+        return result
+
 
 # Function to extract subtitles from video
 def detach_subtitles(input_video, output_subtitles):
     """
     Extract subtitles from the input video and save them to the specified output file.
+
+    The subtitle stream is mapped as optional, so a single ffmpeg run both
+    checks for subtitles and extracts them; no separate ffprobe is needed.
     """
-    try:
-        if has_subtitles(input_video):
-            subprocess.run(['ffmpeg', '-i', input_video, '-map', '0:s:0', '-c', 'copy', output_subtitles], check=True)
-            logging.info(f"Subtitles extracted to {output_subtitles}")
-        else:
-            logging.info(f"No subtitles found in {input_video}")
-    except subprocess.CalledProcessError as e:
-        logging.error(f"Error during subtitle extraction: {e}")
+    result = run_ffmpeg(
+        ['ffmpeg', *FFMPEG_LOG_ARGS, '-y', '-i', input_video, '-map', '0:s:0?', '-c', 'copy', output_subtitles],
+        check=False
+    )
+    if os.path.exists(output_subtitles) and os.path.getsize(output_subtitles) > 0:
+        logging.info(f"Subtitles extracted to {output_subtitles}")
+        return
+
+    # ffmpeg may leave an empty file behind when there is no subtitle stream
+    if os.path.exists(output_subtitles):
+        os.remove(output_subtitles)
+    if result.returncode != 0 and b'does not contain any stream' not in result.stderr:
+        logging.error(f"Error during subtitle extraction: {result.stderr.decode(errors='replace').strip()}")
+    else:
+        logging.info(f"No subtitles found in {input_video}")
 
 def detach_audio(input_video, output_audio, output_video_no_audio):
     """
     Detach audio from the input video and save both the audio and the video without audio.
+    Both outputs are produced by a single ffmpeg run, so the input is demuxed only once.
     """
     try:
         logging.info(f"Detaching audio from: {input_video}")
         
-        # Detach and convert audio
-        ffmpeg_audio_command = [
+        ffmpeg_command = [
             'ffmpeg',
+            *FFMPEG_LOG_ARGS,
             '-y',  # Overwrite output files without asking
             '-i', input_video,
+            # Output 1: converted audio
+            '-map', '0:a:0',
             '-vn',
             '-acodec', 'pcm_s16le',
             '-ar', '16000',
             '-ac', '1',
-            output_audio
-        ]
-        logging.info(f"Extracting and converting audio with command: {' '.join(ffmpeg_audio_command)}")
-        subprocess.run(ffmpeg_audio_command, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        logging.info(f"Audio detached and converted to {output_audio}")
-        
-        # Detach video without audio
-        ffmpeg_video_command = [ 
-            'ffmpeg',
-            '-y',
-            '-i', input_video,
+            output_audio,
+            # Output 2: video without audio
+            '-map', '0:v:0',
             '-an',
             '-vcodec', 'copy',
             output_video_no_audio
         ]
-        logging.info(f"Extracting video without audio with command: {' '.join(ffmpeg_video_command)}")
-        subprocess.run(ffmpeg_video_command, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        logging.info(f"Extracting audio and video without audio with command: {' '.join(ffmpeg_command)}")
+        run_ffmpeg(ffmpeg_command)
+        logging.info(f"Audio detached and converted to {output_audio}")
         logging.info(f"Video (without audio) saved to {output_video_no_audio}")
         
     except subprocess.CalledProcessError as e:
         logging.error(f"Error during audio detachment: {e.stderr.decode().strip()}")
 
 
+def extract_audio_pcm(input_video):
+    """
+    Decode the audio of the input video straight into memory as raw 16 kHz
+    mono 16-bit PCM, without writing a WAV file to disk.
+
+    Returns:
+        bytes, or None if ffmpeg failed.
+    """
+    ffmpeg_command = [
+        'ffmpeg',
+        *FFMPEG_LOG_ARGS,
+        '-i', input_video,
+        '-vn',
+        '-acodec', 'pcm_s16le',
+        '-ar', str(AUDIO_SAMPLE_RATE),
+        '-ac', '1',
+        '-f', 's16le',
+        'pipe:1'
+    ]
+    try:
+        logging.info(f"Extracting audio into memory from: {input_video}")
+        return run_ffmpeg(ffmpeg_command, capture_stdout=True).stdout
+    except subprocess.CalledProcessError as e:
+        logging.error(f"Error during in-memory audio extraction: {e.stderr.decode().strip()}")
+        return None
+
+
+# Event loop reused for every transcription in this process. The async Azure
+# client is a per-process singleton and its connection pool is bound to the
+# loop it was first used on, so asyncio.run (a new loop per call) can't be used.
+_EVENT_LOOP = None
+
+def run_async(coro):
+    """
+    Run a coroutine to completion on this process's persistent event loop.
+    """
+    global _EVENT_LOOP
+    if _EVENT_LOOP is None:
+        _EVENT_LOOP = asyncio.new_event_loop()
+        atexit.register(_close_event_loop)
+    return _EVENT_LOOP.run_until_complete(coro)
+
+
+def _close_event_loop():
+    """
+    Close the shared Azure client's connections, then the event loop itself.
+    Registered with atexit when the loop is created.
+    """
+    try:
+        _EVENT_LOOP.run_until_complete(close_client())
+    except Exception as e:
+        logging.warning(f"Error closing the Azure OpenAI client: {e}")
+    _EVENT_LOOP.close()
+
+
+def chunk_audio(audio_path, seconds=AUDIO_CHUNK_SECONDS):
+    """
+    Split an audio file into consecutive pieces of at most `seconds` using
+    ffmpeg's segment muxer (stream copy, no re-encoding).
+
+    Returns:
+        list of (chunk_path, start_offset_seconds) in playback order.
+        If splitting fails, the whole file is returned as a single chunk.
+    """
+    base, ext = os.path.splitext(audio_path)
+    chunk_pattern = f"{base}_chunk_%03d{ext}"
+    segment_list = f"{base}_chunks.csv"
+    ffmpeg_command = [
+        'ffmpeg',
+        *FFMPEG_LOG_ARGS,
+        '-y',
+        '-i', audio_path,
+        '-f', 'segment',
+        '-segment_time', str(seconds),
+        # Record each piece's actual start time so timestamps can be shifted exactly
+        '-segment_list', segment_list,
+        '-segment_list_type', 'csv',
+        '-c', 'copy',
+        chunk_pattern
+    ]
+    try:
+        run_ffmpeg(ffmpeg_command)
+        audio_dir = os.path.dirname(audio_path)
+        with open(segment_list, newline='', encoding='utf-8') as f:
+            chunks = [
+                (os.path.join(audio_dir, os.path.basename(row[0])), float(row[1]))
+                for row in csv.reader(f) if row
+            ]
+        logging.info(f"Split {audio_path} into {len(chunks)} chunk(s) of up to {seconds} seconds")
+        return chunks or [(audio_path, 0.0)]
+    except subprocess.CalledProcessError as e:
+        logging.error(f"Error splitting {audio_path} into chunks, transcribing it whole: {e.stderr.decode().strip()}")
+    except (OSError, ValueError, IndexError) as e:
+        logging.error(f"Error reading chunk list for {audio_path}, transcribing it whole: {e}")
+    return [(audio_path, 0.0)]
+
+
+def chunk_pcm_audio(pcm_audio, name, seconds=AUDIO_CHUNK_SECONDS):
+    """
+    Split in-memory 16 kHz mono PCM into WAV-encoded pieces of at most
+    `seconds`, the in-memory counterpart of chunk_audio.
+
+    Returns:
+        list of ((filename, wav_bytes), start_offset_seconds) in playback order.
+    """
+    bytes_per_second = AUDIO_SAMPLE_RATE * AUDIO_SAMPLE_WIDTH
+    chunk_size = seconds * bytes_per_second
+    chunks = []
+    for index, start in enumerate(range(0, len(pcm_audio), chunk_size)):
+        buffer = io.BytesIO()
+        with wave.open(buffer, 'wb') as wav_file:
+            wav_file.setnchannels(1)
+            wav_file.setsampwidth(AUDIO_SAMPLE_WIDTH)
+            wav_file.setframerate(AUDIO_SAMPLE_RATE)
+            wav_file.writeframes(pcm_audio[start:start + chunk_size])
+        chunks.append(((f"{name}_chunk_{index:03d}.wav", buffer.getvalue()), start / bytes_per_second))
+    return chunks
+
+
+def read_max_concurrency():
+    """
+    Read the limit on transcription requests in flight from
+    AZURE_OPENAI_MAX_CONCURRENCY (environment or .env), defaulting to
+    DEFAULT_MAX_CONCURRENT_TRANSCRIPTIONS.
+
+    Returns:
+        The limit, or None if the value is not a positive integer.
+    """
+    value = os.getenv("AZURE_OPENAI_MAX_CONCURRENCY")
+    if value is None:
+        return DEFAULT_MAX_CONCURRENT_TRANSCRIPTIONS
+    try:
+        max_concurrent = int(value)
+    except ValueError:
+        return None
+    return max_concurrent if max_concurrent >= 1 else None
+
+
 # Asynchronous function to transcribe multiple audio files concurrently using Azure OpenAI
 async def transcribe_audio(audio_paths, video_output_dir, 
-                           speech_to_text, client, deployment_id):
+                           client, deployment_id, semaphore, in_memory_audio=None):
     """
     Transcribe multiple audio files concurrently using Azure OpenAI.
+
+    semaphore limits the requests in flight and is shared by every chunk of
+    every audio file. in_memory_audio optionally maps an entry of audio_paths
+    to its raw PCM data; such entries are never read from disk.
     """
-    # Define the maximum number of concurrent tasks
-    MAX_CONCURRENT_TRANSACTIONS = 1
-    semaphore = asyncio.Semaphore(MAX_CONCURRENT_TRANSACTIONS)
-    
-    async def sem_transcribe(audio_path):
-        async with semaphore:
-            return await transcribe_single_audio(audio_path, video_output_dir, speech_to_text, client, deployment_id)
+    in_memory_audio = in_memory_audio or {}
     
-    tasks = [sem_transcribe(audio_path) for audio_path in audio_paths]
+    tasks = [
+        transcribe_single_audio(audio_path, video_output_dir, client, deployment_id, semaphore,
+                                pcm_audio=in_memory_audio.get(audio_path))
+        for audio_path in audio_paths
+    ]
     results = await asyncio.gather(*tasks, return_exceptions=True)
     
     # Handle exceptions
@@ -123,60 +313,93 @@ async def transcribe_audio(audio_paths, video_output_dir,
             logging.error(f"Transcription task for {audio_paths[idx]} failed with exception: {result}")
 
 
+async def gather_or_cancel(coros):
+    """
+    Run the coroutines concurrently like asyncio.gather, but on the first
+    failure cancel the ones still running, so they stop holding semaphore
+    slots and API quota for results nobody reads, then raise that failure.
+    """
+    tasks = [asyncio.ensure_future(coro) for coro in coros]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        # Let the cancelled requests wind down before the failure propagates
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
 # Asynchronous function to transcribe a single audio file using Azure OpenAI
 async def transcribe_single_audio(audio_path, video_output_dir, 
-                                  speech_to_text, client, deployment_id):
+                                  client, deployment_id, semaphore, pcm_audio=None):
     """
     Transcribe a single audio file using Azure OpenAI and save the SRT file.
+
+    The file is split into chunks (see chunk_audio) that are transcribed
+    concurrently, limited by `semaphore`, and stitched back together with
+    their time offsets. If pcm_audio is given, it is used instead of reading
+    audio_path, which then only names the output SRT file.
     """
-    
-    print("client and deployment from transcribe_single_audio: ", client, deployment_id)
-    # Ensure the language is English as per user preference
-    if speech_to_text != "en":
-        logging.error("Currently, only English ('en') is supported for transcription.")
-        return
+    logging.debug(f"client and deployment from transcribe_single_audio: {client} {deployment_id}")
 
-    lang = "en"
-    desired_target_lang = "english language"
+    async def transcribe_chunk(chunk):
+        async with semaphore:
+            # In-memory chunks are already (filename, bytes) tuples the client accepts;
+            # chunks on disk are read in a worker thread so the event loop never
+            # blocks on file I/O while other requests are in flight
+            if not isinstance(chunk, tuple):
+                def read_chunk(chunk_path=chunk):
+                    with open(chunk_path, "rb") as audio_file:
+                        return audio_file.read()
+
+                loop = asyncio.get_running_loop()
+                chunk = (os.path.basename(chunk), await loop.run_in_executor(None, read_chunk))
+            return await create_transcription(chunk)
+
+    async def create_transcription(audio_file):
+        return await client.audio.transcriptions.create(
+            file=audio_file,          
+            model=deployment_id,
+            language=TRANSCRIPTION_LANGUAGE,
+            prompt=WHISPER_PROMPT,
+            response_format="verbose_json",
+            timestamp_granularities=["segment"],
+        )
 
-    if os.path.exists(audio_path):
+    if pcm_audio is not None or os.path.exists(audio_path):
         start_time = time.time()
         logging.info(f"Starting processing for {audio_path} at {time.ctime(start_time)}")
         
-        output_srt_file = os.path.join(video_output_dir, f"{os.path.basename(audio_path)}_{lang}.srt")
+        output_srt_file = os.path.join(video_output_dir, os.path.basename(audio_path) + SRT_FILE_SUFFIX)
         
         try:
-            # Run the transcription in a separate thread to avoid blocking the event loop
-            loop = asyncio.get_running_loop()
-            with open(audio_path, "rb") as audio_file:
-                # Define the transcription function
-                def run_transcription():
-                    return client.audio.transcriptions.create(
-                        file=audio_file,          
-                        model=deployment_id,
-                        language=lang,
-                        prompt=f"use the provided audio file, and convert audio speech language into {desired_target_lang}. The output srt formatted file must only contain {desired_target_lang} and not a mix of languages. If the audio file contain only music or some section contain music then ignore music and non vocals.",
-                        response_format="verbose_json",
-                        timestamp_granularities=["segment"],
-                    )
-                
-                # Execute the transcription function in a thread pool executor
-                srt = await loop.run_in_executor(None, run_transcription)
+            if pcm_audio is not None:
+                chunks = chunk_pcm_audio(pcm_audio, os.path.splitext(os.path.basename(audio_path))[0])
+            else:
+                # Splitting runs ffmpeg, so keep it off the event loop
+                loop = asyncio.get_running_loop()
+                chunks = await loop.run_in_executor(None, chunk_audio, audio_path)
+
+            # A missing chunk would leave a silent gap in the subtitles, so
+            # one failed chunk (after the SDK's retries) fails the whole file
+            responses = await gather_or_cancel(transcribe_chunk(chunk) for chunk, _ in chunks)
+            srt = merge_transcriptions(
+                (response, offset) for response, (_, offset) in zip(responses, chunks)
+            )
             
             # Debugging: Print type and attributes of the transcription response
             logging.debug(f"Type of srt: {type(srt)}")
             logging.debug(f"srt attributes: {dir(srt)}")
             logging.debug(f"srt content: {srt}")
             
-            if srt:
+            if srt.segments:
                 logging.info("English transcription and alignment completed.")
-                # Save English SRT
-                srt_content_en = convert_to_srt(srt)
-                intermediate_srt_path_en = output_srt_file
-                save_srt_file(srt_content_en, intermediate_srt_path_en)
-                fix_first_segment_start_time(intermediate_srt_path_en)
+                # Save English SRT, streaming the cues straight to the file
+                save_srt_stream(iter_srt(srt), output_srt_file)
+                fix_first_segment_start_time(output_srt_file)
             else:
-                logging.error(f"Failed to generate English SRT for {intermediate_srt_path_en}.")
+                logging.error(f"Failed to generate English SRT for {output_srt_file}.")
         
         except Exception as e:
             logging.error(f"Error during transcription for {audio_path}: {e}")
@@ -188,25 +411,60 @@ async def transcribe_single_audio(audio_path, video_output_dir,
         logging.warning(f"Audio file '{audio_path}' not found. Skipping transcription.")
 
 
-# Process each video
-def process_video(video_dir, video_path, output_dir, detach_subtitles_flag, detach_audio_flag, speech_to_text, filter_two_stems, device=None,  video_base_name_for_subtitle_name=None, client=None, deployment_id=None):
+def link_or_copy_video(video_path, video_output_dir):
+    """
+    Make video_path available inside video_output_dir without duplicating its
+    data when possible: hardlink first, then symlink, then a full copy.
+
+    Raises ValueError if video_output_dir is the directory holding the video:
+    the cleanup of video_output_dir would then delete the original.
+    """
+    if os.path.realpath(video_output_dir) == os.path.realpath(os.path.dirname(os.path.abspath(video_path))):
+        raise ValueError(f"output directory {video_output_dir} is the directory of the original video")
+    destination = os.path.join(video_output_dir, os.path.basename(video_path))
+    # Already linked by a previous run
+    if os.path.exists(destination) and os.path.samefile(video_path, destination):
+        logging.info(f"Video already present in: {video_output_dir}")
+        return
+    try:
+        os.link(video_path, destination)
+        logging.info(f"Video hardlinked to: {video_output_dir}")
+        return
+    except OSError:
+        pass
+    try:
+        os.symlink(os.path.abspath(video_path), destination)
+        logging.info(f"Video symlinked to: {video_output_dir}")
+        return
+    except OSError:
+        pass
+    shutil.copy(video_path, destination)
+    logging.info(f"Video copied to: {video_output_dir}")
+
+
+# Process each video, stage 1: everything up to stem separation
+def prepare_video(video_dir, video_path, output_dir, detach_subtitles_flag, detach_audio_flag, filter_two_stems):
     """
-    Process a single video: detach subtitles, detach audio, separate audio stems, and transcribe audio.
+    Prepare a single video for transcription: place it in its output
+    directory, detach subtitles, and detach audio.
+
+    With filter_two_stems the audio is written to disk for Demucs but not
+    separated yet (see separate_prepared_audio): the worker processes don't
+    load Demucs, and the main process keeps one model resident for every
+    video. Otherwise it is decoded straight into memory.
 
     Args:
         video_path (str): Path to the video file.
         output_dir (str): Directory where processed files will be saved.
         detach_subtitles_flag (bool): Whether to detach subtitles.
         detach_audio_flag (bool): Whether to detach audio.
-        speech_to_text (str): Language for speech-to-text conversion.
-        filter_two_stems (bool): Whether to separate audio into two stems.
-        device (str): Device to use ('cpu' or 'gpu').
-        client (AzureOpenAI): Azure OpenAI client.
-        deployment_id (str): Azure deployment ID.
-        
+        filter_two_stems (bool): Whether the audio will be separated into two stems.
+
+    Returns:
+        (video_output_dir, audio_paths, in_memory_audio, audio_to_separate),
+        where audio_to_separate is the detached audio file still waiting for
+        separation (or None); or None if the video could not be set up.
     """
-    print(device, "from inside the process_video")
-    
     video_name = os.path.splitext(os.path.basename(video_path))[0]
     logging.info(f"VARIABLE video_name from inside process directory: {video_name} ")
     logging.info(f"VARIABLE video_dir from inside process directory: {video_dir} ")
@@ -215,20 +473,22 @@ def process_video(video_dir, video_path, output_dir, detach_subtitles_flag, deta
     logging.info(f"VARIABLE video_output_dir video_name from inside process directory: {video_output_dir} ")
     os.makedirs(video_output_dir, exist_ok=True)
     
-    # Copy the original video to the video_output_dir
+    # Place the original video in the video_output_dir. It is only a reference
+    # copy, so prefer a hardlink, then a symlink, and only copy the data when
+    # neither is possible (e.g. across filesystems)
     try:
-        shutil.copy(video_path, video_output_dir)
-        logging.info(f"Video copied to: {video_output_dir}")
-        logging.info(f"Video copied to: {video_output_dir}")
+        link_or_copy_video(video_path, video_output_dir)
     except Exception as e:
         logging.error(f"Error copying video {video_path} to {video_output_dir}: {e}")
-        return
+        return None
 
     output_subtitles = os.path.join(video_output_dir, f"{video_dir}_subtitles.srt")
     output_audio = os.path.join(video_output_dir, f"{video_dir}_audio.wav")  # Detached audio
     output_video_no_audio = os.path.join(video_output_dir, f"{video_dir}_no_audio.mp4")
 
     audio_paths = []  # Initialize the list to store audio paths
+    in_memory_audio = {}  # Audio path -> raw PCM, for audio that was never written to disk
+    audio_to_separate = None
 
     # Step 1: Detach subtitles if flag is set
     if detach_subtitles_flag:
@@ -246,78 +506,111 @@ def process_video(video_dir, video_path, output_dir, detach_subtitles_flag, deta
 
     # Step 2: Detach audio if flag is set
     if detach_audio_flag:
-        detach_audio(video_path, output_audio, output_video_no_audio)
-
-        # Step 3: Filter out videos with two audio stems (only if Step 2 was successful)
+        # Step 3 (separate_prepared_audio) filters out the non-vocals stem, only
+        # if Step 2 was successful. Demucs reads the detached audio from disk,
+        # so write it out in this case
         if filter_two_stems:
+            detach_audio(video_path, output_audio, output_video_no_audio)
+
             # Check if detach_audio was successful by verifying the existence of output_audio
             if os.path.exists(output_audio):
-                vocals_path, non_vocals_path = separate_audio(output_audio, video_output_dir, device)
-                if vocals_path and non_vocals_path:
-                    logging.info(f"Separated audio into {vocals_path} and {non_vocals_path}")
-                    
-                    # ---- Additional Cleanup Steps Start ----
-                    # Step 1: Ensure only the processed vocals file is used
-                    processed_vocals_path = os.path.join(video_output_dir, f"{video_dir}_audio_vocals_processed.mp3")
-                    logging.info(f"Processed vocals path: {processed_vocals_path}")
-                    if os.path.exists(processed_vocals_path):
-                        logging.info(f"Found processed vocals file: {processed_vocals_path}")
-                        # Remove the original vocals.wav if it exists
-                        original_vocals_path = os.path.join(video_output_dir, f"{video_dir}_audio_vocals.wav")
-                        if os.path.exists(original_vocals_path):
-                            os.remove(original_vocals_path)
-                            logging.info(f"Removed original vocals file: {original_vocals_path}")
-                        else:
-                            logging.info(f"Original vocals file not found at: {original_vocals_path}")
-                        # Set audio_paths to only the processed vocals
-                        audio_paths = [processed_vocals_path]
-                    else:
-                        logging.error(f"Error: Processed vocals file not found at: {processed_vocals_path}")
-                        logging.info("Falling back to using the original audio for transcription.")
-                        audio_paths = [output_audio]
-                    # ---- Additional Cleanup Steps End ----
-                else:
-                    logging.error("Audio separation failed. Falling back to original audio for transcription.")
-                    audio_paths = [output_audio]
+                audio_to_separate = output_audio
             else:
                 logging.error(f"Error: Audio file {output_audio} not found after detaching audio.")
                 logging.info("Skipping filtering and proceeding with original audio for transcription.")
-                audio_paths = [output_audio]
+            audio_paths = [output_audio]
         else:
-            # If not filtering, use the detached audio for transcription
-            if os.path.exists(output_audio):
+            # If not filtering, the audio goes straight to transcription, so
+            # decode it into memory instead of writing and re-reading a WAV file
+            pcm_audio = extract_audio_pcm(video_path)
+            if pcm_audio:
+                in_memory_audio[output_audio] = pcm_audio
                 audio_paths = [output_audio]
             else:
-                logging.error(f"Detached audio file {output_audio} not found.")
+                logging.error(f"Audio could not be extracted from {video_path}.")
     else:
         # If not detaching audio, look for existing audio files (optional)
         # For this script, we'll proceed only if audio is detached
         logging.info("Audio detachment not requested. Skipping audio processing.")
         audio_paths = []
 
-    # Handle transcription if audio exists
+    return video_output_dir, audio_paths, in_memory_audio, audio_to_separate
+
+
+# Process each video, stage 2: stem separation with the resident Demucs model
+def separate_prepared_audio(prepared, device):
+    """
+    Separate the detached audio of a prepared video into two stems, and
+    switch the video over to its processed vocals. A video whose separation
+    fails keeps its original audio.
+
+    Args:
+        prepared (tuple): Result of prepare_video; its audio_paths are updated in place.
+        device (str): Device to use ('cpu' or 'cuda').
+    """
+    video_output_dir, audio_paths, _, audio_to_separate = prepared
+    if not audio_to_separate:
+        return
+
+    vocals_path, non_vocals_path = separate_audio(audio_to_separate, video_output_dir, device)
+    if vocals_path and non_vocals_path:
+        logging.info(f"Separated audio into {vocals_path} and {non_vocals_path}")
+        # Use only the processed (mono, 16 kHz MP3) vocals for transcription
+        audio_paths[:] = [vocals_path]
+    else:
+        logging.error("Audio separation failed. Falling back to original audio for transcription.")
+
+
+# Process each video, stage 3: transcription and cleanup
+async def transcribe_prepared_video(prepared, client, deployment_id, semaphore):
+    """
+    Transcribe the audio of a prepared video and clean up its output directory.
+
+    Args:
+        prepared (tuple): Result of prepare_video.
+        client (AsyncAzureOpenAI): Azure OpenAI client.
+        deployment_id (str): Azure deployment ID.
+        semaphore (asyncio.Semaphore): Limit on the requests in flight.
+    """
+    video_output_dir, audio_paths, in_memory_audio, _ = prepared
+
+    # Handle transcription if audio exists; list the output directory once
+    # instead of stat-ing each candidate path
+    with os.scandir(video_output_dir) as it:
+        existing_files = {entry.name for entry in it}
     transcription_tasks = []
     for audio_path in audio_paths:
-        if os.path.exists(audio_path):
+        if audio_path in in_memory_audio or os.path.basename(audio_path) in existing_files:
             logging.info(f"Audio file found: {audio_path}")
             transcription_tasks.append(audio_path)
         else:
             logging.warning(f"Audio file {audio_path} not found. Skipping transcription.")
-            
-    print("client and deployment: ", client, deployment_id)
+
+    # Start the largest audio first (longest processing time first), so a
+    # long file picked up last doesn't become the tail of the gather
+    def audio_size(audio_path):
+        if audio_path in in_memory_audio:
+            return len(in_memory_audio[audio_path])
+        return os.path.getsize(audio_path)
+
+    transcription_tasks.sort(key=audio_size, reverse=True)
+
+    logging.debug(f"client and deployment: {client} {deployment_id}")
 
     if transcription_tasks:
         # Run the asynchronous transcription
         try:
-            asyncio.run(transcribe_audio(
+            await transcribe_audio(
                 transcription_tasks,  # List of audio paths
                 video_output_dir,
-                speech_to_text,
                 client,
-                deployment_id
-            ))
+                deployment_id,
+                semaphore,
+                in_memory_audio=in_memory_audio
+            )
             # Cleanup: Remove all files except .srt files
-            cleanup_output_dir(video_output_dir)
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, cleanup_output_dir, video_output_dir)
             # video_dir_name = os.path.basename(video_output_dir)
             # new_filename = f"{video_dir_name}_subtitles.srt"
             # os.rename(new_filename, f"{video_base_name_for_subtitle_name}.srt")
@@ -327,39 +620,188 @@ def process_video(video_dir, video_path, output_dir, detach_subtitles_flag, deta
     else:
         logging.info("No valid audio files found for transcription.")
 
+    # The raw audio is no longer needed once the video is transcribed
+    in_memory_audio.clear()
+
+
+async def process_group(jobs, executor, separation_executor, device,
+                        client, deployment_id, semaphore, ready_slots):
+    """
+    Run the videos of one output directory through every stage, one video
+    at a time: they write to the same file names, and the cleanup of the
+    directory removes every file but the subtitles.
+
+    Args:
+        jobs (list): _prepare_one jobs that share an output directory.
+        executor (ProcessPoolExecutor): Pool for the ffmpeg work.
+        separation_executor (ThreadPoolExecutor): Single thread owning the Demucs model.
+        device (str): Device to use ('cpu' or 'cuda').
+        client (AsyncAzureOpenAI): Azure OpenAI client.
+        deployment_id (str): Azure deployment ID.
+        semaphore (asyncio.Semaphore): Limit on the requests in flight.
+        ready_slots (asyncio.Semaphore): Limit on the videos whose decoded
+            audio is held in memory, from preparation until transcribed.
+    """
+    loop = asyncio.get_running_loop()
+    for job in jobs:
+        async with ready_slots:
+            try:
+                prepared = await asyncio.wrap_future(executor.submit(_prepare_one, job))
+            except Exception as e:
+                logging.error(f"Processing failed for {job[1]}: {e}")
+                continue
+            if prepared is None:
+                continue
+            await loop.run_in_executor(separation_executor, separate_prepared_audio, prepared, device)
+            # Frees the decoded audio of the video once it is transcribed
+            await transcribe_prepared_video(prepared, client, deployment_id, semaphore)
+
+
+async def process_all(groups, max_workers, device, client, deployment_id, max_concurrent):
+    """
+    Process every group of videos on one event loop. Groups run
+    concurrently: their ffmpeg work shares a pool of max_workers processes,
+    their stem separation shares one Demucs model, and their transcription
+    shares one semaphore of max_concurrent requests, so requests overlap
+    across videos as well as within them.
+
+    At most READY_VIDEOS_PER_WORKER * max_workers videos are prepared but
+    not yet transcribed at any time, which bounds the decoded audio held in
+    memory however many videos there are.
+    """
+    semaphore = asyncio.Semaphore(max_concurrent)
+    ready_slots = asyncio.Semaphore(READY_VIDEOS_PER_WORKER * max_workers)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor, \
+            ThreadPoolExecutor(max_workers=1) as separation_executor:
+        await asyncio.gather(*(
+            process_group(jobs, executor, separation_executor, device,
+                          client, deployment_id, semaphore, ready_slots)
+            for jobs in groups
+        ))
+
+
 # Function to convert .mov to .mp4
 def converting_non_mp4_to_mp4(input_video_path, output_video_path):
     """
     Convert a .mov video to .mp4 format using ffmpeg.
 
+    The streams are first remuxed as-is (most .mov files already carry
+    H.264/AAC); only if that fails is the video re-encoded.
+
     Parameters:
     - input_video_path (str): Path to the input .mov video.
     - output_video_path (str): Desired path for the output .mp4 video.
     """
     try:
         logging.info(f"Starting conversion: {input_video_path} to {output_video_path}")
+
+        # First try a stream copy into the .mp4 container, no decoding involved
+        remux_command = [
+            'ffmpeg',
+            *FFMPEG_LOG_ARGS,
+            '-y',
+            '-i', input_video_path,          # Input file
+            '-c', 'copy',                    # Copy all streams without re-encoding
+            '-movflags', '+faststart',       # Move the index to the front of the file
+            output_video_path                 # Output file
+        ]
+        result = run_ffmpeg(remux_command, check=False)
+        if result.returncode == 0:
+            logging.info(f"Successfully remuxed {input_video_path} to {output_video_path}")
+            return
+        logging.info(f"Stream copy not possible for {input_video_path}, re-encoding: {result.stderr.decode().strip()}")
         
         # ffmpeg command to convert .mov to .mp4
         ffmpeg_command = [
             'ffmpeg',
+            *FFMPEG_LOG_ARGS,
+            '-y',
             '-i', input_video_path,          # Input file
             '-c:v', 'libx264',               # Video codec
+            '-threads', '0',                 # Let x264 use all cores
+            '-preset', 'veryfast',           # Much faster than the default 'medium'
+            '-crf', '23',                    # Constant quality
             '-c:a', 'aac',                   # Audio codec
             '-strict', 'experimental',       # Allow experimental codecs if needed
-            output_video_path                 # Output file
+            '-movflags', '+faststart',       # Move the index to the front of the file
+            output_video_path                # Output file
         ]
         
         # Execute the ffmpeg command
-        subprocess.run(ffmpeg_command, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        run_ffmpeg(ffmpeg_command)
         
         logging.info(f"Successfully converted {input_video_path} to {output_video_path}")
         
     except subprocess.CalledProcessError as e:
         error_message = e.stderr.decode().strip()
         logging.error(f"Error converting {input_video_path} to mp4: {error_message}")
+        # Do not leave a partial file behind; callers check for its existence
+        if os.path.exists(output_video_path):
+            os.remove(output_video_path)
+
+
+def iter_videos(root):
+    """
+    Recursively yield the paths of supported video files under root.
+    Non-video files are filtered by name alone, before any other work.
+    """
+    with os.scandir(root) as it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False):
+                yield from iter_videos(entry.path)
+            elif entry.name.lower().endswith(VIDEO_EXTS):
+                yield entry.path
+
+
+def _mp4_video_path(video_path):
+    """
+    Convert a .mov video to .mp4 next to the original and return the path
+    to process, or None if the conversion failed.
+    """
+    if video_path.lower().endswith('.mov'):
+        # Define the output .mp4 path
+        output_mp4_path = os.path.splitext(video_path)[0] + '.mp4'
+        
+        # Convert .mov to .mp4
+        converting_non_mp4_to_mp4(video_path, output_mp4_path)
+        
+        # Check if conversion was successful
+        if not os.path.exists(output_mp4_path):
+            logging.info(f"Failed to convert {video_path}. Skipping processing.")
+            return None
+        logging.info(f"Processing converted video: {output_mp4_path}")
+        
+        # Optionally, remove the original .mov file to save space
+        # os.remove(video_path)
+        # logging.info(f"Removed original .mov file: {video_path}")
+        return output_mp4_path
+
+    logging.info(f"Processing video: {video_path}")
+    return video_path
+
+
+# Worker entry point for the process pool: prepare_video for one video
+def _prepare_one(job):
+    """
+    Convert the video to .mp4 if needed and run prepare_video on it.
+
+    Takes a single picklable tuple so it can be submitted to a
+    ProcessPoolExecutor. Returns the prepare_video result, or None if the
+    video was skipped.
+    """
+    video_dir, video_path, output_dir, detach_subtitles_flag, detach_audio_flag, filter_two_stems = job
+
+    logging_setup.configure()
+
+    video_path = _mp4_video_path(video_path)
+    if video_path is None:
+        return None
+    return prepare_video(video_dir, video_path, output_dir, detach_subtitles_flag, detach_audio_flag, filter_two_stems)
 
 
 def main():
+    logging_setup.configure()
+
     parser = argparse.ArgumentParser(description="Process videos by detaching subtitles, detaching audio, and performing speech-to-text conversion.")
     
     parser.add_argument('--input-dir', required=True, help='Path to the directory containing the original videos to be processed.')
@@ -384,11 +826,17 @@ def main():
     # we are going to use only azure openai
     parser.add_argument('--secrets-dir',  required=True, help='Directory containing .env file with API key.')
 
+    parser.add_argument('--workers', type=int, help='Number of videos whose audio is extracted in parallel, each in its own process. Defaults to the number of CPUs (capped at the number of video directories). Videos in the same directory are always processed one after another.')
+
     args = parser.parse_args()
     
     if not args.speech_to_text:
         logging.warning("The --speech-to-text flag was not used. Transcription will not be performed.")
 
+    if args.workers is not None and args.workers < 1:
+        logging.error(f"--workers must be a positive integer, got: {args.workers}")
+        sys.exit(1)
+
     if args.speech_to_text.lower() not in SUPPORTED_LANGUAGES:
         logging.error(f"Unsupported language code: {args.speech_to_text}")
         sys.exit(1)
@@ -399,11 +847,14 @@ def main():
         logging.error("API key not found in the secrets directory.")
         sys.exit(1)
 
-     # 2) Create a client (Azure)
+    # 2) Create a client (Azure); transcription for every video runs in this process
     client, deployment_id = create_client(creds)
-    
-    # Since we're only using Azure, no need for OpenAI API key
-    azure_client = client  # For clarity
+
+    # Validate the request limit now, not after all videos have been prepared
+    max_concurrent = read_max_concurrency()
+    if max_concurrent is None:
+        logging.error(f"AZURE_OPENAI_MAX_CONCURRENCY must be a positive integer, got: {os.getenv('AZURE_OPENAI_MAX_CONCURRENCY')!r}")
+        sys.exit(1)
     
     # If output directory is not provided, use the parent directory of input directory
     if not args.output_dir:
@@ -426,76 +877,42 @@ def main():
     start_time = time.time()
     logging.info(f"Execution started at {time.ctime(start_time)}")
 
-    # Process each video in the input directory
-    for root, dirs, files in os.walk(args.input_dir):
-        for video_file in files:
-            video_path = os.path.join(root, video_file)
-            
-            # Extract the directory name
-            video_dir = os.path.basename(os.path.dirname(video_path))
-            
-            logging.info(f"VARIABLE video_dir from main function: {video_dir}")
-            logging.info(f"VARIABLE video_path from main function: {video_path}")
-            logging.info(f"VARIABLE args.output_dir from main function: {args.output_dir}")
-            
-            # video_path = /mnt/c/Users/Hamid/Desktop/机械制造技术/（翻译后）机械制造技术/1.1.1 Introduction to mechanical engineering technology.mov and I want just video_base_name without .mov 
-            video_base_name_with_ext = os.path.basename(video_path)
-            video_base_name_for_subtitle_name, ext = os.path.splitext(video_base_name_with_ext)
-            logging.info(f"VARIABLE video_base_name_for_subtitle_name for subtitles name: {video_base_name_for_subtitle_name}")
-            
-            # Check if the file has a supported video extension
-            if video_file.lower().endswith(('.mp4', '.avi', '.mov', '.mkv')):
-                if video_file.lower().endswith('.mov'):
-                    # Define the output .mp4 path
-                    output_mp4_path = os.path.splitext(video_path)[0] + '.mp4'
-                    
-                    # Convert .mov to .mp4
-                    converting_non_mp4_to_mp4(video_path, output_mp4_path)
-                    
-                    # Check if conversion was successful
-                    if os.path.exists(output_mp4_path):
-                        logging.info(f"Processing converted video: {output_mp4_path}")
-                        logging.info(f"Processing converted video: {output_mp4_path}")
-                        
-                        # Pass azure_client and deployment_id to process_video
-                        process_video(
-                            video_dir,
-                            output_mp4_path, 
-                            args.output_dir,
-                            args.detach_subtitles, 
-                            args.detach_audio, 
-                            args.speech_to_text, 
-                            args.filter_two_stems, 
-                            device=device,
-                            client=azure_client,
-                            deployment_id=deployment_id,
-                            video_base_name_for_subtitle_name=video_base_name_for_subtitle_name
-                        )
-                        
-                        # Optionally, remove the original .mov file to save space
-                        # os.remove(video_path)
-                        # logging.info(f"Removed original .mov file: {video_path}")
-                    else:
-                        logging.info(f"Failed to convert {video_path}. Skipping processing.")
-                else:
-                    logging.info(f"Processing video: {video_path}")
-                    
-                    # Pass azure_client and deployment_id to process_video
-                    process_video(
-                        video_dir,
-                        video_path, 
-                        args.output_dir,
-                        args.detach_subtitles, 
-                        args.detach_audio, 
-                        args.speech_to_text, 
-                        args.filter_two_stems, 
-                        device=device,
-                        client=azure_client,
-                        deployment_id=deployment_id,
-                        video_base_name_for_subtitle_name=video_base_name_for_subtitle_name
-                    )
-            else:
-                logging.info(f"Skipping unsupported file: {video_path}")
+    # Collect one job per video in the input directory, grouped by the
+    # output directory the video is processed in
+    video_paths = list(iter_videos(args.input_dir))
+    video_path_set = set(video_paths)
+    groups = {}
+    for video_path in video_paths:
+        # A .mov is converted to the .mp4 next to it; if that .mp4 is already
+        # in the list (e.g. from an earlier run), process it only once
+        if video_path.lower().endswith('.mov') and os.path.splitext(video_path)[0] + '.mp4' in video_path_set:
+            logging.info(f"Skipping {video_path}: its converted .mp4 is already being processed.")
+            continue
+
+        # Extract the directory name
+        video_dir = os.path.basename(os.path.dirname(video_path))
+        
+        logging.info(f"VARIABLE video_dir from main function: {video_dir}")
+        logging.info(f"VARIABLE video_path from main function: {video_path}")
+        logging.info(f"VARIABLE args.output_dir from main function: {args.output_dir}")
+        
+        groups.setdefault(video_dir, []).append((
+            video_dir,
+            video_path,
+            args.output_dir,
+            args.detach_subtitles,
+            args.detach_audio,
+            args.filter_two_stems
+        ))
+
+    # Prepare the videos (ffmpeg work) in parallel worker processes, separate
+    # their stems with one Demucs model, and transcribe them on a single event
+    # loop; each video is transcribed as soon as it is ready
+    if groups:
+        max_workers = args.workers or min(os.cpu_count() or 1, len(groups))
+        logging.info(f"Processing {sum(map(len, groups.values()))} videos in {len(groups)} directories with {max_workers} worker(s)")
+        run_async(process_all(list(groups.values()), max_workers, device,
+                              client, deployment_id, max_concurrent))
                         
     end_time = time.time()
     logging.info(f"Execution finished at {time.ctime(end_time)}")
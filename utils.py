@@ -1,100 +1,158 @@
 
-import sys
 import logging
+import mmap
 import os
-from datetime import datetime, timedelta
-import re
-
-# Set up logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stdout),
-        # Uncomment the following line to also log to a file
-        # logging.FileHandler("transcription.log")
-    ]
-)
+import shutil
+from datetime import timedelta
+from functools import lru_cache
+from types import SimpleNamespace
+
 logger = logging.getLogger(__name__)
 
-def convert_to_srt(transcription_response):
+def iter_srt(transcription_response):
     """
-    Convert the transcription response into SRT format.
+    Yield the transcription response in SRT format, one complete cue at a
+    time, so it can be written out without building the whole text first.
+
+    Segments missing a start time, an end time or text are skipped, and the
+    remaining cues are numbered consecutively.
     """
     # Access segments directly as an attribute
-    segments = transcription_response.segments if hasattr(transcription_response, 'segments') else []
+    segments = getattr(transcription_response, 'segments', None) or []
     
     if not segments:
         logging.warning("No transcription segments found.")
-        return ""
+        return
 
-    srt_output = []
     index = 1
+    warning_enabled = logger.isEnabledFor(logging.WARNING)
+    # Bind the per-segment helpers to locals (fast local loads instead of
+    # global/builtin lookups on every iteration)
+    _getattr = getattr
+    _format_time = format_time
+
+    # Segments are validated with plain None checks below, so one try around
+    # the whole loop is enough; an unexpected failure ends the output there
+    segment = None  # Still None if iterating the segments itself fails
+    try:
+        for segment in segments:
+            # Fetch each attribute once, cheapest checks first: the text is
+            # only fetched and stripped for segments that have both times
+            start_time = _getattr(segment, 'start', None)
+            end_time = _getattr(segment, 'end', None)
+            text = None
+            if start_time is not None and end_time is not None:
+                text = (_getattr(segment, 'text', None) or '').strip()
+
+            if not text:
+                # Noisy responses can skip many segments; only build the
+                # message when warnings are actually emitted
+                if warning_enabled:
+                    logger.warning("Skipping incomplete segment: %s", segment)
+                continue
 
-    for segment in segments:
-        try:
-            # Access segment attributes directly
-            start_time = segment.start if hasattr(segment, 'start') else None
-            end_time = segment.end if hasattr(segment, 'end') else None
-            text = segment.text.strip() if hasattr(segment, 'text') else ''
+            # Index, timing (HH:MM:SS,mmm), text, and a blank line to separate
+            # subtitles, built as one string per cue
+            yield f"{index}\n{_format_time(start_time)} --> {_format_time(end_time)}\n{text}\n\n"
 
-            if start_time is None or end_time is None or not text:
-                logging.warning(f"Skipping incomplete segment: {segment}")
-                continue
+            index += 1
+    except Exception as e:
+        logger.error("Error processing segment %s: %s", segment, e)
 
-            # Format the start and end times in SRT format (HH:MM:SS,MS)
-            start_str = format_time(start_time)
-            end_str = format_time(end_time)
 
-            srt_output.append(f"{index}")
-            srt_output.append(f"{start_str} --> {end_str}")
-            srt_output.append(text)
-            srt_output.append("")  # Blank line to separate subtitles
+def convert_to_srt(transcription_response):
+    """
+    Convert the transcription response into SRT format.
+    """
+    return "".join(iter_srt(transcription_response))
 
-            index += 1
-        except Exception as e:
-            logging.error(f"Error processing segment {segment}: {e}")
-            continue
 
-    return "\n".join(srt_output)
+def merge_transcriptions(responses_with_offsets):
+    """
+    Merge the transcription responses of consecutive audio chunks into one
+    response-like object whose segment times are relative to the full audio.
+
+    Args:
+        responses_with_offsets: iterable of (response, offset_seconds) pairs,
+            where offset_seconds is the chunk's start time in the full audio.
+
+    Returns:
+        An object with a `segments` list, accepted by convert_to_srt.
+    """
+    segments = []
+    for response, offset in responses_with_offsets:
+        for segment in getattr(response, 'segments', None) or []:
+            start = getattr(segment, 'start', None)
+            end = getattr(segment, 'end', None)
+            segments.append(SimpleNamespace(
+                start=None if start is None else start + offset,
+                end=None if end is None else end + offset,
+                text=getattr(segment, 'text', '')
+            ))
+    return SimpleNamespace(segments=segments)
 
 
 def format_time(seconds):
     """
-    Convert seconds to SRT time format: HH:MM:SS,MS
+    Convert seconds to SRT time format: HH:MM:SS,mmm (milliseconds always
+    three digits, as the format requires).
     """
-    hours = int(seconds // 3600)
-    minutes = int((seconds % 3600) // 60)
-    secs = int(seconds % 60)
-    milliseconds = int((seconds - int(seconds)) * 1000)
-    return f"{hours:02}:{minutes:02}:{secs:02},{milliseconds:02}"
+    # Work in whole milliseconds (rounded once) so every field comes from
+    # exact integer math instead of repeated float // and %
+    return _format_ms(int(seconds * 1000 + 0.5))
+
+# A segment usually starts where the previous one ended, so each boundary
+# would otherwise be formatted twice; memoized by integer milliseconds
+@lru_cache(maxsize=8192)
+def _format_ms(total_ms: int) -> str:
+    secs, milliseconds = divmod(total_ms, 1000)
+    minutes, secs = divmod(secs, 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d},{milliseconds:03d}"
 
 def save_srt_file(srt_content, output_path):
     """
     Save the SRT content to the specified output file.
+
+    The content is encoded once and written as bytes in a single call,
+    bypassing the text layer (and its newline translation).
+    """
+    try:
+        with open(output_path, 'wb') as srt_file:
+            srt_file.write(srt_content.encode('utf-8'))
+        logging.info(f"SRT file saved: {output_path}")
+    except Exception as e:
+        logging.error(f"Error saving SRT file: {e}")
+
+def save_srt_stream(srt_chunks, output_path):
+    """
+    Write SRT text produced piece by piece (e.g. by iter_srt) to the
+    specified output file, without joining it into one string first.
     """
     try:
-        with open(output_path, 'w', encoding='utf-8') as srt_file:
-            srt_file.write(srt_content)
+        with open(output_path, 'w', encoding='utf-8', newline='\n', buffering=1 << 20) as srt_file:
+            srt_file.writelines(srt_chunks)
         logging.info(f"SRT file saved: {output_path}")
     except Exception as e:
         logging.error(f"Error saving SRT file: {e}")
 
 # Helper function to parse SRT timestamp
 def parse_srt_timestamp(timestamp: str) -> timedelta:
-    return datetime.strptime(timestamp, "%H:%M:%S,%f") - datetime(1900, 1, 1)
+    # Fixed HH:MM:SS,mmm layout, parsed with plain int() rather than strptime
+    hours, minutes, rest = timestamp.strip().split(':')
+    seconds, _, fraction = rest.partition(',')
+    # Like strptime's %f, a short fraction is a decimal fraction (",5" is 500 ms)
+    milliseconds = int(fraction[:3].ljust(3, '0'))
+    return timedelta(hours=int(hours), minutes=int(minutes), seconds=int(seconds), milliseconds=milliseconds)
+
+_ONE_MILLISECOND = timedelta(milliseconds=1)
 
 # Helper function to format timedelta to SRT timestamp format
 def format_srt_timestamp(td: timedelta) -> str:
-    total_seconds = int(td.total_seconds())
-    milliseconds = int((td.total_seconds() - total_seconds) * 1000)
-    formatted_time = str(timedelta(seconds=total_seconds))
-    if '.' in formatted_time:
-        formatted_time = formatted_time.split('.')[0]
-    # Ensure hours are zero-padded to 2 digits
-    if len(formatted_time.split(':')[0]) < 2:
-        formatted_time = f"0{formatted_time}"
-    return f"{formatted_time},{milliseconds:03d}"
+    # Whole milliseconds via timedelta // timedelta (exact integer math), then
+    # the same memoized formatter as format_time. An estimate reaching back
+    # before the start of the audio is clamped to 00:00:00,000
+    return _format_ms(max(td // _ONE_MILLISECOND, 0))
 
 # Estimate audio length based on word count (words per minute average 150)
 def estimate_audio_length(word_count: int, wpm=50) -> timedelta:
@@ -107,27 +165,26 @@ def fix_first_segment_start_time(srt_file_path):
     Adjust the start time of the first subtitle segment based on an estimated audio length.
     """
     try:
-        with open(srt_file_path, 'r', encoding='utf-8') as file:
-            srt_content = file.read()
-
-        # Split the SRT content into blocks for each subtitle
-        srt_blocks = srt_content.strip().split('\n\n')
-
-        if not srt_blocks:
-            logging.warning(f"No subtitle blocks found in {srt_file_path}.")
-            return
-
-        # Get the first subtitle block (index 0)
-        first_segment = srt_blocks[0]
+        with open(srt_file_path, 'rb') as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                logging.warning(f"No subtitle blocks found in {srt_file_path}.")
+                return
+
+            # Map the file instead of reading it: only the first subtitle block
+            # is decoded, and the rest of the file is never split into blocks
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as srt_map:
+                first_block_end = srt_map.find(b'\n\n')
+                if first_block_end == -1:
+                    first_block_end = len(srt_map)
+                first_segment = srt_map[:first_block_end].decode('utf-8')
         
-        # Extract the timestamp and content from the first segment
-        match = re.match(r'(\d+)\n([\d:,]+) --> ([\d:,]+)\n(.+)', first_segment, re.DOTALL)
-        if match:
-            segment_number = match.group(1)
-            start_time = match.group(2)
-            end_time = match.group(3)
-            text = match.group(4)
-
+        # Extract the timestamp and content from the first segment: an SRT cue
+        # is an index line, a "start --> end" line, then the text
+        parts = first_segment.strip().split('\n', 2)
+        segment_number = parts[0]
+        start_time, separator, end_time = parts[1].partition(' --> ') if len(parts) > 1 else ('', '', '')
+        text = parts[2] if len(parts) > 2 else ''
+        if segment_number.isdigit() and separator and text:
             # Count the words in the segment text (naive word count)
             word_count = len(text.split())
             
@@ -141,18 +198,34 @@ def fix_first_segment_start_time(srt_file_path):
             # Format the new start time
             corrected_start_time = format_srt_timestamp(correct_start_time)
 
-            # Replace the start time in the first segment
-            updated_first_segment = first_segment.replace(start_time, corrected_start_time, 1)
-            
-            # Reconstruct the entire SRT content with the updated first segment
-            updated_srt_content = updated_first_segment + '\n\n' + '\n\n'.join(srt_blocks[1:])
-
-            # Write the updated content back to the SRT file
-            with open(srt_file_path, 'w', encoding='utf-8') as file:
-                file.write(updated_srt_content)
+            # Byte offset of the start time in the file; everything before it
+            # (the cue index) is ASCII, so it matches the character offset
+            start_offset = len(first_segment[:first_segment.find(start_time)].encode('utf-8'))
+            if len(corrected_start_time) == len(start_time) and corrected_start_time.isascii():
+                # Same width (HH:MM:SS,mmm), so overwrite just those bytes in place
+                with open(srt_file_path, 'r+b') as file:
+                    file.seek(start_offset)
+                    file.write(corrected_start_time.encode('ascii'))
+            else:
+                # Replace the start time in the first segment
+                updated_first_segment = first_segment.replace(start_time, corrected_start_time, 1)
+
+                # Write the updated first segment, followed by the rest of the file
+                # as-is, to a temporary file and swap it in, so a crash mid-write
+                # can't leave a truncated SRT behind
+                temp_path = srt_file_path + '.tmp'
+                try:
+                    with open(srt_file_path, 'rb') as source, open(temp_path, 'wb') as file:
+                        file.write(updated_first_segment.encode('utf-8'))
+                        source.seek(first_block_end)
+                        shutil.copyfileobj(source, file)
+                    os.replace(temp_path, srt_file_path)
+                finally:
+                    if os.path.exists(temp_path):
+                        os.remove(temp_path)
 
             logging.info(f"First segment start time corrected to: {corrected_start_time}")
         else:
             logging.error(f"Failed to parse SRT content in {srt_file_path}.")
     except Exception as e:
-        logging.error(f"Error in fix_first_segment_start_time: {e}")
\ No newline at end of file
+        logging.error(f"Error in fix_first_segment_start_time: {e}")